@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Post-processing of scraped page content, so results shrink before they are
+written to disk or uploaded to the remote server.
+
+extract_main_text() is a readability-style extractor. It drops script/nav/
+footer/aside elements and blocks whose class or id looks like boilerplate
+(menus, cookie banners, share bars, related links), unless the element holds
+most of the page's paragraph text. It then scores every
+container by the paragraph text it holds and its link density, and keeps the
+best container plus any sibling that scores close to it. The extracted text
+has one block (paragraph, heading, list item) per line.
+
+ContentPostProcessor then works on the extracted text of a query's results:
+
+    1. optionally splits it into passages of about passage_tokens tokens and
+       keeps the top_passages passages ranked by BM25 against the query
+       (in document order),
+    2. caps it at max_tokens tokens and max_chars characters.
+
+It can also attach the top-N query-relevant snippets of each page. The
+passages of all the query's results are scored with BM25 as one collection. Only query terms are counted, as a sparse
+(passage, term) matrix, and the scoring is vectorized with numpy when it is
+installed, with a pure-Python fallback otherwise.
+
+Token counts are approximate (words and punctuation marks), which is close
+enough for budgeting LLM context without depending on a tokenizer.
+"""
+import math
+import re
+from collections import Counter
+from itertools import chain
+
+from metrics import span
+
+
+# Never hold page text; always removed
+NON_CONTENT_TAGS = ("script", "style", "noscript", "template", "svg", "canvas", "iframe", "button", "select")
+# Usually boilerplate, but removed only when they do not hold most of the page's text
+BOILERPLATE_TAGS = ("nav", "header", "footer", "aside", "figure")
+BLOCK_TAGS = ("p", "pre", "blockquote", "li", "h1", "h2", "h3", "h4", "h5", "h6", "td", "dd")
+_SCORED_TAGS = ("p", "pre", "blockquote", "td")
+_KEEP_TAGS = ("html", "body", "article", "main")
+
+_BOILERPLATE_HINT_RE = re.compile(
+    r"(^|[\W_])(nav|navbar|menu|breadcrumbs?|footer|masthead|sidebar|widget|comments?|cookies?|consent|"
+    r"banner|share|sharing|social|related|recommended|promo|sponsored|advert|ads?|newsletter|subscribe|"
+    r"signup|popup|modal|skip|pagination|tags)([\W_]|$)",
+    re.IGNORECASE,
+)
+_CONTENT_HINT_RE = re.compile(r"article|body|content|entry|main|post|story|text", re.IGNORECASE)
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_TERM_RE = re.compile(r"\w+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?。！？])\s+")
+
+MIN_BLOCK_CHARS = 25
+MAX_REMOVED_TEXT_SHARE = 0.5
+DEFAULT_PASSAGE_TOKENS = 120
+DEFAULT_SNIPPET_TOKENS = 50
+
+
+# ------------------------------
+# Boilerplate removal
+# ------------------------------
+
+
+def _hint(tag) -> str:
+    classes = tag.get("class") or []
+    if isinstance(classes, str):
+        classes = [classes]
+    return " ".join(classes) + " " + (tag.get("id") or "")
+
+
+def _paragraph_chars(tag) -> int:
+    return sum(len(p.get_text(strip=True)) for p in tag.find_all("p"))
+
+
+def remove_boilerplate(soup):
+    """
+    Removes non-content elements from a BeautifulSoup document in place.
+
+    An element that holds more than MAX_REMOVED_TEXT_SHARE of the document's
+    <p> text is kept whatever its tag or class, so page-wide wrappers such as
+    ASP.NET's <form id="aspnetForm"> or <div class="has-sidebar"> survive.
+    Forms are removed only when they hold no paragraph text.
+    """
+    for tag in soup.find_all(NON_CONTENT_TAGS):
+        if not tag.decomposed:
+            tag.decompose()
+
+    max_removed_chars = _paragraph_chars(soup) * MAX_REMOVED_TEXT_SHARE
+
+    def remove(tag):
+        if _paragraph_chars(tag) <= max_removed_chars:
+            tag.decompose()
+
+    for tag in soup.find_all(True):
+        if tag.decomposed or tag.name in _KEEP_TAGS:
+            continue
+        hint = _hint(tag)
+        if tag.name in BOILERPLATE_TAGS:
+            remove(tag)
+        elif tag.name == "form":
+            if _paragraph_chars(tag) < MIN_BLOCK_CHARS:
+                tag.decompose()
+        elif _BOILERPLATE_HINT_RE.search(hint) and not _CONTENT_HINT_RE.search(hint):
+            remove(tag)
+        elif tag.get("role") in ("navigation", "banner", "contentinfo", "complementary", "dialog"):
+            remove(tag)
+        elif tag.get("aria-hidden") == "true" or tag.get("hidden") is not None:
+            remove(tag)
+
+
+def _link_density(tag, text_length: int) -> float:
+    if not text_length:
+        return 1.0
+    link_chars = sum(len(a.get_text(" ", strip=True)) for a in tag.find_all("a"))
+    return min(1.0, link_chars / text_length)
+
+
+def _block_texts(container) -> list[str]:
+    blocks = []
+    for el in container.find_all(BLOCK_TAGS):
+        # A <p> inside an <li> is already part of the <li>'s text
+        if el.find_parent(BLOCK_TAGS) is not None:
+            continue
+        text = el.get_text(" ", strip=True)
+        if text:
+            blocks.append(text)
+    return blocks
+
+
+def extract_main_text(soup, min_block_chars: int = MIN_BLOCK_CHARS) -> str:
+    """
+    Returns the main text of a BeautifulSoup document, one block per line,
+    or "" when no container holds enough paragraph text.
+
+    The document is modified: boilerplate elements are removed first.
+    """
+    remove_boilerplate(soup)
+
+    # id(container) -> [container, score]
+    candidates: dict[int, list] = {}
+    for block in soup.find_all(_SCORED_TAGS):
+        text = block.get_text(" ", strip=True)
+        if len(text) < min_block_chars:
+            continue
+        score = 1 + text.count(",") + text.count("，") + min(len(text) // 100, 3)
+        parent = block.parent
+        for weight in (1.0, 0.5):
+            if parent is None or parent.name is None or parent.name == "[document]":
+                break
+            entry = candidates.setdefault(id(parent), [parent, 0.0])
+            entry[1] += score * weight
+            parent = parent.parent
+    if not candidates:
+        return ""
+
+    scored = []
+    for container, score in candidates.values():
+        text_length = len(container.get_text(" ", strip=True))
+        if _CONTENT_HINT_RE.search(_hint(container)) or container.name in ("article", "main"):
+            score *= 1.25
+        scored.append((score * (1.0 - _link_density(container, text_length)), container))
+    best_score, best = max(scored, key=lambda item: item[0])
+    if best_score <= 0:
+        return ""
+
+    # Siblings that score close to the best container are usually split-up article parts
+    sibling_scores = {id(c): s for s, c in scored}
+    parts = [best]
+    if best.parent is not None:
+        parts = [
+            sibling for sibling in best.parent.find_all(True, recursive=False)
+            if sibling is best or sibling_scores.get(id(sibling), 0.0) >= max(10.0, best_score * 0.2)
+        ]
+
+    blocks = []
+    for part in parts:
+        blocks.extend(_block_texts(part) or [part.get_text(" ", strip=True)])
+    return "\n".join(b for b in blocks if b)
+
+
+# ------------------------------
+# Token budgeting
+# ------------------------------
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count: words and punctuation marks."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def truncate_text(text: str, max_chars: int | None = None, max_tokens: int | None = None) -> str:
+    """
+    Cuts text to at most max_tokens tokens and max_chars characters, at the
+    last sentence end when one is near the cut, otherwise at a word boundary.
+    """
+    cut = len(text)
+    if max_tokens is not None:
+        for i, match in enumerate(_TOKEN_RE.finditer(text)):
+            if i == max_tokens:
+                cut = match.start()
+                break
+    if max_chars is not None:
+        cut = min(cut, max_chars)
+    if cut >= len(text):
+        return text
+
+    head = text[:cut]
+    sentence_end = max(head.rfind(". "), head.rfind(".\n"), head.rfind("\n"), head.rfind("。"))
+    if sentence_end >= cut * 0.8:
+        return head[:sentence_end + 1].rstrip()
+    if cut < len(text) and not text[cut].isspace():
+        space = head.rfind(" ")
+        if space > 0:
+            head = head[:space]
+    return head.rstrip()
+
+
+# ------------------------------
+# Passages and BM25
+# ------------------------------
+
+
+def split_passages(text: str, passage_tokens: int = DEFAULT_PASSAGE_TOKENS) -> list[str]:
+    """
+    Splits text into passages of at most about passage_tokens tokens, packing
+    whole lines (blocks) together and splitting long blocks at sentence ends.
+
+    Sizes are counted in whitespace-separated words here, which is much
+    cheaper than count_tokens and close enough for passage boundaries. A
+    passage shorter than a quarter of passage_tokens is merged into its
+    neighbour, since BM25's length normalization would otherwise rank such a
+    fragment above the full passages around it.
+    """
+    # (text, word count) pieces of at most passage_tokens words each
+    pieces = []
+    for block in text.split("\n"):
+        words = block.split()
+        if len(words) <= passage_tokens:
+            if words:
+                pieces.append((" ".join(words), len(words)))
+            continue
+        for sentence in _SENTENCE_END_RE.split(block.strip()):
+            words = sentence.split()
+            # No sentence end to split at: cut into equal chunks of at most
+            # passage_tokens words rather than leaving a short remainder
+            num_chunks = -(-len(words) // passage_tokens)
+            size = -(-len(words) // num_chunks) if words else 0
+            for i in range(0, len(words), size or 1):
+                chunk = words[i:i + size]
+                pieces.append((" ".join(chunk), len(chunk)))
+
+    passages = []  # [text parts, word count]
+    for piece, tokens in pieces:
+        if not passages or passages[-1][1] + tokens > passage_tokens:
+            passages.append([[], 0])
+        passages[-1][0].append(piece)
+        passages[-1][1] += tokens
+
+    min_tokens = passage_tokens // 4
+    merged = []
+    for parts, tokens in passages:
+        if merged and (tokens < min_tokens or merged[-1][1] < min_tokens):
+            merged[-1][0].extend(parts)
+            merged[-1][1] += tokens
+        else:
+            merged.append([parts, tokens])
+    return [" ".join(parts) for parts, _ in merged]
+
+
+def terms(text: str) -> list[str]:
+    return _TERM_RE.findall(text.lower())
+
+
+_np = None
+
+
+def _numpy():
+    # numpy is optional and only imported when passages are first scored
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = False
+    return _np or None
+
+
+def _query_term_matches(query_terms: list[str], passages: list[str]):
+    """
+    Returns the query terms occurring in each passage (one entry per
+    occurrence) and the length of every passage in words.
+
+    A single regex over the query terms finds the occurrences, so words that
+    are not query terms are never looked at in Python.
+    """
+    alternatives = "|".join(map(re.escape, sorted(query_terms, key=len, reverse=True)))
+    pattern = re.compile(rf"\b(?:{alternatives})\b")
+    matches = [pattern.findall(p.lower()) for p in passages]
+    lengths = [len(p.split()) for p in passages]
+    return matches, lengths
+
+
+def _bm25_numpy(np, query_terms, matches, lengths, k1, b):
+    # Term frequencies as a dense (passage x query term) matrix, filled from
+    # the sparse occurrence list with one bincount
+    num_passages, num_terms = len(matches), len(query_terms)
+    term_ids = {t: i for i, t in enumerate(query_terms)}
+    counts = np.fromiter(map(len, matches), dtype=np.int64, count=num_passages)
+    rows = np.repeat(np.arange(num_passages, dtype=np.int64), counts)
+    cols = np.fromiter(map(term_ids.__getitem__, chain.from_iterable(matches)), dtype=np.int64,
+                       count=int(counts.sum()))
+    tf = np.bincount(rows * num_terms + cols, minlength=num_passages * num_terms)
+    tf = tf.reshape(num_passages, num_terms).astype(np.float64)
+
+    length = np.asarray(lengths, dtype=np.float64)
+    avg_length = length.mean() or 1.0
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((num_passages - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * length / avg_length)
+    return (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def _bm25_python(query_terms, matches, lengths, k1, b):
+    num_passages = len(matches)
+    tf = [Counter(m) for m in matches]
+    avg_length = (sum(lengths) / num_passages) or 1.0
+    df = Counter(term for counts in tf for term in counts)
+    idf = {t: math.log1p((num_passages - df[t] + 0.5) / (df[t] + 0.5)) for t in query_terms}
+
+    scores = []
+    for counts, length in zip(tf, lengths):
+        norm = k1 * (1 - b + b * length / avg_length)
+        scores.append(sum(idf[t] * n * (k1 + 1) / (n + norm) for t, n in counts.items()))
+    return scores
+
+
+def bm25_scores(query: str, passages: list[str], k1: float = 1.5, b: float = 0.75) -> list[float]:
+    """
+    Scores each passage against query with Okapi BM25, using the passages
+    themselves as the collection for document frequencies.
+
+    Uses numpy when it is installed and a pure-Python loop otherwise; both
+    return the same scores.
+    """
+    query_terms = sorted(set(terms(query)))
+    if not passages or not query_terms:
+        return [0.0] * len(passages)
+    matches, lengths = _query_term_matches(query_terms, passages)
+    np = _numpy()
+    if np is not None:
+        return _bm25_numpy(np, query_terms, matches, lengths, k1, b).tolist()
+    return _bm25_python(query_terms, matches, lengths, k1, b)
+
+
+def rank_passages(query: str, passage_lists: list[list[str]], top_n: int,
+                  k1: float = 1.5, b: float = 0.75) -> list[list[tuple[int, float]]]:
+    """
+    Ranks the passages of several documents against query in one batch.
+
+    All passages share one collection, so a term that appears on every page
+    of the batch weighs less than one specific to a few passages.
+
+    Returns:
+        list: For each document, up to top_n (passage index, score) pairs, best first.
+    """
+    flat = [p for passages in passage_lists for p in passages]
+    scores = bm25_scores(query, flat, k1, b)
+
+    ranked, start = [], 0
+    for passages in passage_lists:
+        end = start + len(passages)
+        order = sorted(range(start, end), key=lambda i: (-scores[i], i))[:top_n]
+        ranked.append([(i - start, scores[i]) for i in order])
+        start = end
+    return ranked
+
+
+def select_passages(query: str, text: str, top_passages: int,
+                    passage_tokens: int = DEFAULT_PASSAGE_TOKENS) -> str:
+    """
+    Returns the top_passages passages of text most relevant to query, in
+    document order, or text unchanged when it has no more passages than that.
+    """
+    passages = split_passages(text, passage_tokens)
+    if len(passages) <= top_passages:
+        return text
+    ranked = rank_passages(query, [passages], top_passages)[0]
+    return "\n".join(passages[i] for i in sorted(i for i, _ in ranked))
+
+
+# ------------------------------
+# Pipeline
+# ------------------------------
+
+
+class ContentPostProcessor:
+    """
+    Shrinks the `content` of each search result in place.
+
+    With snippets set, each result gets a "snippets" list of its top
+    snippets passages (about snippet_tokens tokens each) ranked against the
+    query, best first, as {"text", "score"}; passages without any query term
+    are left out. Snippets are ranked on the full content.
+
+    With top_passages set, content is reduced to the passages most relevant
+    to the query. It is then capped at max_tokens tokens and max_chars
+    characters. Results whose content was shortened get "content_truncated":
+    true.
+
+    process_batch() ranks the passages of a query's whole result list as one
+    collection, so a page's scores do not depend on how its results were
+    grouped; process() is the same for a single result.
+    """
+
+    def __init__(
+        self,
+        max_chars: int | None = None,
+        max_tokens: int | None = None,
+        top_passages: int | None = None,
+        passage_tokens: int = DEFAULT_PASSAGE_TOKENS,
+        snippets: int | None = None,
+        snippet_tokens: int = DEFAULT_SNIPPET_TOKENS,
+    ):
+        self.max_chars = max_chars
+        self.max_tokens = max_tokens
+        self.top_passages = top_passages
+        self.passage_tokens = passage_tokens
+        self.snippets = snippets
+        self.snippet_tokens = snippet_tokens
+
+    @property
+    def enabled(self) -> bool:
+        return any(v is not None for v in (self.max_chars, self.max_tokens, self.top_passages, self.snippets))
+
+    def _select_passages(self, results: list[dict], query: str) -> set[int]:
+        """Keeps the top_passages best passages of each result; returns the ids of shortened results."""
+        passage_lists = [split_passages(r["content"], self.passage_tokens) for r in results]
+        with span("passage_ranking"):
+            ranked_lists = rank_passages(query, passage_lists, self.top_passages)
+        shortened = set()
+        for result, passages, ranked in zip(results, passage_lists, ranked_lists):
+            if len(passages) > self.top_passages:
+                result["content"] = "\n".join(passages[i] for i in sorted(i for i, _ in ranked))
+                shortened.add(id(result))
+        return shortened
+
+    def _add_snippets(self, results: list[dict], query: str):
+        passage_lists = [split_passages(r["content"], self.snippet_tokens) for r in results]
+        with span("snippet_ranking"):
+            ranked_lists = rank_passages(query, passage_lists, self.snippets)
+        for result, passages, ranked in zip(results, passage_lists, ranked_lists):
+            result["snippets"] = [
+                {"text": passages[i], "score": round(score, 3)} for i, score in ranked if score > 0
+            ]
+
+    def process_batch(self, results: list[dict], query: str | None = None) -> list[dict]:
+        with_content = [r for r in results if r.get("content")]
+        if not with_content or not self.enabled:
+            return results
+        if self.snippets and query:
+            self._add_snippets(with_content, query)
+        shortened = set()
+        if self.top_passages is not None and query:
+            shortened = self._select_passages(with_content, query)
+        for result in with_content:
+            truncated = id(result) in shortened
+            if self.max_chars is not None or self.max_tokens is not None:
+                capped = truncate_text(result["content"], self.max_chars, self.max_tokens)
+                # truncate_text returns its input itself when nothing was cut
+                truncated = truncated or capped is not result["content"]
+                result["content"] = capped
+            result["content_truncated"] = truncated
+        return results
+
+    def process(self, result: dict, query: str | None = None) -> dict:
+        self.process_batch([result], query)
+        return result
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Structured, low-overhead logging for the crawler scripts.
+
+All loggers live under the "crawler" namespace. configure_logging() installs a
+QueueHandler, so worker threads only enqueue records; formatting (JSON by
+default) and terminal I/O happen on a single background listener thread.
+
+Per-URL messages carry a `url` field (pass extra={"url": ...}). Below
+WARNING they are sampled at `url_sample_rate` before they are enqueued, and
+most of them are DEBUG, so at INFO level they are dropped by a level check
+before a record is even created.
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+
+LOGGER_NAME = "crawler"
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def get_logger(name: str | None = None) -> logging.Logger:
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        stamp = time.strftime("%H:%M:%S", time.localtime(record.created))
+        line = f"{stamp} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class UrlSamplingFilter(logging.Filter):
+    """Keeps one in every 1/rate per-URL records below WARNING."""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.period = max(1, round(1.0 / rate)) if rate > 0 else 0
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not hasattr(record, "url"):
+            return True
+        if self.period == 0:
+            return False
+        return next(self._counter) % self.period == 0
+
+
+def configure_logging(
+    level: str | int = "INFO",
+    fmt: str = "json",
+    stream=None,
+    url_sample_rate: float = 1.0,
+) -> logging.Logger:
+    """
+    Routes the "crawler" loggers through a queue to one stream handler.
+
+    Safe to call again; the previous listener is stopped and replaced.
+    """
+    global _listener
+
+    logger = logging.getLogger(LOGGER_NAME)
+    _stop_listener()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(UrlSamplingFilter(url_sample_rate))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+
+    logger.addHandler(queue_handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    return logger
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Duplicate detection for search results and scraped page content.
+
+URLs are canonicalized before scraping so tracking parameters, http vs https,
+trailing slashes, "www."/"m."/"amp." hosts and AMP paths do not make one page
+look like several.
+
+Each page's `content` is reduced to a 64-bit SimHash over word 3-shingles.
+Syndicated copies, mirrors and AMP versions of one article differ in a few
+words only, so their fingerprints differ in a few bits. Two pages count as
+near-duplicates when the fraction of equal bits is at least the configured
+similarity threshold.
+
+Lookups split the fingerprint into (max distance + 1) bands: by the
+pigeonhole principle any fingerprint within the distance shares at least one
+band exactly, so only the entries in matching band buckets are compared.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+
+_WORD_RE = re.compile(r"\w+")
+
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "gbraid", "wbraid", "dclid", "msclkid", "yclid", "igshid", "twclid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok", "vero_id", "sr_share",
+}
+# Common tracking names that some sites also use as real parameters (a
+# forum's ?source=, a code host's ?ref=branch). Dropped only on request, via
+# canonicalize_url(url, extra_params=EXTRA_TRACKING_PARAMS).
+EXTRA_TRACKING_PARAMS = frozenset({
+    "ref", "ref_src", "ref_url", "referrer", "source", "src", "share", "amp",
+    "spm", "cmpid", "ito", "ocid",
+})
+_TRACKING_PREFIXES = ("utm_", "pk_", "hsa_", "oly_")
+_HOST_PREFIXES = ("www.", "m.", "mobile.", "amp.")
+
+
+def canonicalize_url(url: str, extra_params=()) -> str:
+    """
+    Returns a normalized form of url for duplicate detection (not for fetching).
+
+    The scheme becomes https, the host is lowercased without a "www."/"m."/
+    "amp." prefix or default port, tracking parameters and the fragment are
+    dropped, the remaining parameters are sorted, and AMP path segments and
+    trailing slashes are removed. Parameters named in extra_params (lowercase)
+    are dropped as well. A malformed url (e.g. a non-numeric port) is returned
+    unchanged, so it only ever matches itself.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    host = (parts.hostname or "").lower()
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+
+    path = re.sub(r"/+", "/", parts.path or "/")
+    path = re.sub(r"(/amp)+(/|\.html)?$", "", path) or "/"
+    path = re.sub(r"\.amp(\.html)?$", r"\1", path)
+    path = re.sub(r"/index\.(html?|php)$", "/", path)
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and k.lower() not in extra_params
+        and not k.lower().startswith(_TRACKING_PREFIXES)
+    )
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def simhash(text: str) -> int:
+    """Returns the 64-bit SimHash of text (0 for text without words)."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    if not shingles:
+        return 0
+
+    hashes = [
+        format(int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+        for s in set(shingles)
+    ]
+    # Count the set bits per position column-wise; tuple.count runs in C
+    half = len(hashes) / 2
+    fingerprint = 0
+    for column in zip(*hashes):
+        fingerprint = (fingerprint << 1) | (column.count("1") > half)
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class NearDuplicateIndex:
+    """
+    Fingerprints of already accepted pages, optionally persisted to a JSONL file.
+
+    A page is a duplicate when an indexed page of a different (query, link)
+    is within the similarity threshold. Re-scraping the same link for the
+    same query, e.g. when resuming a crashed run, is not a duplicate.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.9, path: str | None = None):
+        if not 0.0 < similarity_threshold <= 1.0:
+            raise ValueError("similarity_threshold must be in (0, 1]")
+        self.similarity_threshold = similarity_threshold
+        self.max_distance = int((1.0 - similarity_threshold) * FINGERPRINT_BITS)
+        self.path = path
+        self._num_bands = self.max_distance + 1
+        self._band_bits = FINGERPRINT_BITS // self._num_bands
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in range(self._num_bands)]
+        # entry id -> (fingerprint, query, link)
+        self._entries: list[tuple[int, str | None, str | None]] = []
+        self._keys: set[tuple[str | None, str | None]] = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._add_entry(int(entry["fp"], 16), entry.get("query"), entry.get("link"))
+                except (ValueError, KeyError):
+                    continue
+
+    def _bands(self, fingerprint: int):
+        mask = (1 << self._band_bits) - 1
+        for band in range(self._num_bands):
+            yield band, (fingerprint >> (band * self._band_bits)) & mask
+
+    def _add_entry(self, fingerprint: int, query: str | None, link: str | None):
+        entry_id = len(self._entries)
+        self._entries.append((fingerprint, query, link))
+        self._keys.add((query, link))
+        for band, value in self._bands(fingerprint):
+            self._buckets[band].setdefault(value, []).append(entry_id)
+
+    def find_duplicate(self, fingerprint: int, query: str | None = None, link: str | None = None) -> str | None:
+        """Returns the link of an indexed near-duplicate, or None."""
+        seen = set()
+        for band, value in self._bands(fingerprint):
+            for entry_id in self._buckets[band].get(value, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                other_fp, other_query, other_link = self._entries[entry_id]
+                if other_query == query and other_link == link:
+                    continue
+                if hamming_distance(fingerprint, other_fp) <= self.max_distance:
+                    return other_link or ""
+        return None
+
+    def check_and_add(self, content: str, query: str | None = None, link: str | None = None) -> str | None:
+        """
+        Fingerprints content and indexes it unless it is a near-duplicate.
+
+        Returns the link of the page it duplicates, or None if it was added.
+        """
+        if not content:
+            return None
+        fingerprint = simhash(content)
+        with self._lock:
+            duplicate_of = self.find_duplicate(fingerprint, query, link)
+            if duplicate_of is not None:
+                return duplicate_of
+            if (query, link) in self._keys:
+                return None
+            self._add_entry(fingerprint, query, link)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(
+                        json.dumps(
+                            {"fp": format(fingerprint, "016x"), "query": query, "link": link},
+                            ensure_ascii=False,
+                        )
+                        + "\n"
+                    )
+            return None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for google-web-crawler, without touching real Google.
+
+A local stand-in server plays both Google and the result websites:
+
+    GET /search?q=...&num=N   SERP HTML (synthetic, or a recorded page with
+                              its result links rewritten to local articles)
+    GET /article/<n>          synthetic article page
+
+with configurable latency, page size and failure rate. The driver then runs
+`scrape_multiple_pages_concurrent`, `simulate_search_api` and the remote
+server/client end to end against it and reports queries/sec, pages/sec,
+p50/p99 latency and the peak resident memory (RSS) of each scenario.
+
+Example:
+
+    python google-web-crawler-bench.py --queries 20 --top-k 5 \\
+        --latency-ms 200 --failure-rate 0.1 --output bench.json
+"""
+import argparse
+import html
+import importlib
+import importlib.util
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote_plus, urlparse
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REMOTE_SCRIPT = os.path.join(BASE_DIR, "google-web-crawler-remote.py")
+
+_WORDS = (
+    "model data search result page content network training language system "
+    "learning neural article research method paper benchmark token query index"
+).split()
+
+
+# ------------------------------
+# Mock Google + mock websites
+# ------------------------------
+
+
+class MockConfig:
+    def __init__(
+        self,
+        latency_ms: float = 100.0,
+        jitter_ms: float = 50.0,
+        serp_latency_ms: float = 50.0,
+        page_kb: float = 20.0,
+        failure_rate: float = 0.0,
+        recorded_serp: str | None = None,
+        seed: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.serp_latency_ms = serp_latency_ms
+        self.page_kb = page_kb
+        self.failure_rate = failure_rate
+        self.recorded_serp = recorded_serp
+        self.seed = seed
+
+
+def _synthetic_text(article_id: int, size_bytes: int) -> list[str]:
+    rng = random.Random(article_id)
+    paragraphs, total = [], 0
+    while total < size_bytes:
+        para = " ".join(rng.choice(_WORDS) for _ in range(60)) + f" ref{article_id}-{len(paragraphs)}."
+        paragraphs.append(para)
+        total += len(para)
+    return paragraphs
+
+
+def render_article(article_id: int, size_bytes: int) -> str:
+    body = "\n".join(f"<p>{p}</p>" for p in _synthetic_text(article_id, size_bytes))
+    return (
+        "<html><head>"
+        f"<title>Article {article_id}</title>"
+        f'<meta name="description" content="Synthetic article {article_id}">'
+        '<meta property="article:published_time" content="2024-01-01T00:00:00Z">'
+        "</head><body><nav>Home | About | Contact</nav>"
+        f"<article><h1>Article {article_id}</h1>{body}</article>"
+        "<footer>Copyright</footer></body></html>"
+    )
+
+
+def render_serp(base_url: str, query: str, num: int) -> str:
+    # 与 parse_google_results 解析的结构保持一致：div > a(/url?q=...) > h3 + div[data-sncf]
+    rng = random.Random(query)
+    items = []
+    for i in range(num):
+        article_id = rng.randrange(1_000_000)
+        target = f"{base_url}/article/{article_id}"
+        title = html.escape(f"{query} result {i + 1}")
+        items.append(
+            f'<div class="g"><a href="/url?q={quote_plus(target)}&amp;sa=U"><h3>{title}</h3></a>'
+            f'<div data-sncf="1">Snippet for {title}</div></div>'
+        )
+    return f'<html><body><div id="search">{"".join(items)}</div></body></html>'
+
+
+def rewrite_recorded_serp(page: str, base_url: str) -> str:
+    """Points every external result link of a recorded SERP at a local article."""
+    counter = iter(range(1_000_000))
+
+    def _rewrite(match: re.Match) -> str:
+        return f'{match.group(1)}{quote_plus(f"{base_url}/article/{next(counter)}")}'
+
+    page = re.sub(r'(href="/url\?q=)(https?%3A[^"&]+|https?://[^"&]+)', _rewrite, page)
+    return re.sub(
+        r'href="https?://(?!www\.google\.)[^"]+"',
+        lambda m: f'href="{base_url}/article/{next(counter)}"',
+        page,
+    )
+
+
+class MockSiteHandler(BaseHTTPRequestHandler):
+    server_version = "MockGoogle/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body: str, status: int = 200, head_only: bool = False):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(payload)
+
+    def _sleep(self, mean_ms: float, jitter_ms: float):
+        delay = max(0.0, random.gauss(mean_ms, jitter_ms)) / 1000.0
+        if delay:
+            time.sleep(delay)
+
+    def _handle(self, head_only: bool):
+        conf: MockConfig = self.server.mock_config
+        parsed = urlparse(self.path)
+        base_url = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+
+        if parsed.path == "/search":
+            qs = parse_qs(parsed.query)
+            query = qs.get("q", [""])[0]
+            num = int(qs.get("num", ["10"])[0])
+            if not head_only:
+                self._sleep(conf.serp_latency_ms, conf.serp_latency_ms / 4)
+            if conf.recorded_serp:
+                body = rewrite_recorded_serp(self.server.recorded_serp_html, base_url)
+            else:
+                body = render_serp(base_url, query, num)
+            self._send(body, head_only=head_only)
+            return
+
+        match = re.fullmatch(r"/article/(\d+)", parsed.path)
+        if match:
+            if head_only:
+                self._send("", head_only=True)
+                return
+            self._sleep(conf.latency_ms, conf.jitter_ms)
+            if random.random() < conf.failure_rate:
+                self._send("<html><body>error</body></html>", status=HTTPStatus.INTERNAL_SERVER_ERROR)
+                return
+            self._send(render_article(int(match.group(1)), int(conf.page_kb * 1024)))
+            return
+
+        self._send("not found", status=HTTPStatus.NOT_FOUND, head_only=head_only)
+
+    def do_GET(self):
+        self._handle(head_only=False)
+
+    def do_HEAD(self):
+        self._handle(head_only=True)
+
+
+def start_mock_server(conf: MockConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    httpd = ThreadingHTTPServer((host, port), MockSiteHandler)
+    httpd.daemon_threads = True
+    httpd.mock_config = conf
+    httpd.recorded_serp_html = ""
+    if conf.recorded_serp:
+        with open(conf.recorded_serp, "r", encoding="utf-8") as f:
+            httpd.recorded_serp_html = f.read()
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+# ------------------------------
+# Measurement helpers
+# ------------------------------
+
+
+def _load_script(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)  # type: ignore[union-attr]
+    return module
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def current_rss_mb() -> float | None:
+    """Returns this process's current resident set size, or None if unknown."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+class PeakRssMeter:
+    """
+    Measures the peak RSS of the process while one scenario runs.
+
+    ru_maxrss is a process-wide peak, so later scenarios would inherit the
+    peak of earlier ones. On Linux the kernel's high-water mark (VmHWM) is
+    reset through /proc/self/clear_refs when the meter starts; elsewhere a
+    background thread samples the current RSS.
+    """
+
+    SAMPLE_INTERVAL = 0.01
+
+    def __init__(self):
+        self.before = current_rss_mb()
+        self._peak = self.before
+        self._stop = threading.Event()
+        self._sampler = None
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            self._use_hwm = self._read_hwm_mb() is not None
+        except OSError:
+            self._use_hwm = False
+        if not self._use_hwm and self.before is not None:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+
+    @staticmethod
+    def _read_hwm_mb() -> float | None:
+        try:
+            with open("/proc/self/status", encoding="ascii") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    def _sample(self):
+        while not self._stop.wait(self.SAMPLE_INTERVAL):
+            rss = current_rss_mb()
+            if rss is not None and rss > self._peak:
+                self._peak = rss
+
+    def stop(self) -> tuple[float | None, float | None]:
+        """Returns (peak_rss_mb, rss_after_mb) since the meter was created."""
+        after = current_rss_mb()
+        if self._use_hwm:
+            return self._read_hwm_mb(), after
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        peaks = [v for v in (self._peak, after) if v is not None]
+        return (max(peaks) if peaks else None), after
+
+
+def summarize(name: str, elapsed: float, latencies: list[float], queries: int, pages: int,
+              rss: PeakRssMeter) -> dict:
+    peak, after = rss.stop()
+    row = {
+        "scenario": name,
+        "seconds": round(elapsed, 3),
+        "queries": queries,
+        "pages": pages,
+        "queries_per_sec": round(queries / elapsed, 3) if elapsed > 0 else None,
+        "pages_per_sec": round(pages / elapsed, 3) if elapsed > 0 else None,
+        "p50_latency_s": round(percentile(latencies, 50) or 0.0, 4),
+        "p99_latency_s": round(percentile(latencies, 99) or 0.0, 4),
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "rss_before_mb": round(rss.before, 1) if rss.before is not None else None,
+        "rss_after_mb": round(after, 1) if after is not None else None,
+    }
+    print(
+        f"📊 {name}: {row['queries_per_sec']} queries/sec, {row['pages_per_sec']} pages/sec, "
+        f"p50 {row['p50_latency_s']}s, p99 {row['p99_latency_s']}s, "
+        f"peak RSS {row['peak_rss_mb']} MB (RSS {row['rss_before_mb']} -> {row['rss_after_mb']} MB)"
+    )
+    return row
+
+
+# ------------------------------
+# Scenarios
+# ------------------------------
+
+
+def bench_scrape(crawler, base_url: str, queries: list[str], top_k: int, max_workers: int) -> dict:
+    latencies, pages = [], 0
+    rss = PeakRssMeter()
+    started = time.perf_counter()
+    for query in queries:
+        html_page = urllib.request.urlopen(
+            f"{base_url}/search?q={quote_plus(query)}&num={top_k}"
+        ).read().decode("utf-8")
+        google_results = crawler.parse_google_results(html_page, top_k)
+        t0 = time.perf_counter()
+        results = crawler.scrape_multiple_pages_concurrent(
+            google_results, max_workers=max_workers, delay_between_batches=0
+        )
+        latencies.append(time.perf_counter() - t0)
+        pages += len(results)
+    return summarize("scrape_multiple_pages_concurrent", time.perf_counter() - started, latencies, len(queries), pages,
+                     rss)
+
+
+def bench_search_api(crawler, queries: list[str], top_k: int, max_workers: int) -> dict:
+    fetcher = crawler.TieredSearchFetcher(use_http=True, use_browser=False)
+    latencies, pages = [], 0
+    rss = PeakRssMeter()
+    started = time.perf_counter()
+    for query in queries:
+        t0 = time.perf_counter()
+        results = crawler.simulate_search_api(
+            query, top_k=top_k, max_workers=max_workers, search_fetcher=fetcher, delay_between_batches=0
+        )
+        latencies.append(time.perf_counter() - t0)
+        pages += len(results)
+    return summarize("simulate_search_api", time.perf_counter() - started, latencies, len(queries), pages, rss)
+
+
+def bench_remote(remote, queries: list[str], top_k: int) -> dict:
+    rss = PeakRssMeter()
+    remote.GLOBAL_STORE.attach_result_store(remote.ShardedResultStore(tempfile.mkdtemp(prefix="bench_store_")))
+    httpd = HTTPServer(("127.0.0.1", 0), remote.APIServerHandler)
+    httpd.auth_token = None
+    httpd.output_dir = None
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    server_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    started = time.perf_counter()
+    task_ids = [remote.GLOBAL_STORE.enqueue(remote.Task(query=q, top_k=top_k)) for q in queries]
+    client = threading.Thread(
+        target=remote.client_loop,
+        kwargs=dict(
+            server_base_url=server_url,
+            token=None,
+            poll_interval=0.05,
+            disable_http_proxy=True,
+            search_mode="http",
+            scrape_delay=0.0,
+            max_tasks=len(task_ids),
+        ),
+        daemon=True,
+    )
+    client.start()
+    client.join()
+    elapsed = time.perf_counter() - started
+    httpd.shutdown()
+
+    latencies, pages = [], 0
+    for task_id in task_ids:
+        task = remote.GLOBAL_STORE.get_task(task_id)
+        if task and task.finished_at:
+            latencies.append(task.finished_at - task.created_at)
+        pages += len(remote.GLOBAL_STORE.get_result(task_id) or [])
+    return summarize("remote server + client", elapsed, latencies, len(queries), pages, rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against a local mock Google")
+    parser.add_argument("--queries", type=int, default=10, help="Number of distinct queries")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-workers", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Mean article latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Article latency std deviation")
+    parser.add_argument("--serp-latency-ms", type=float, default=50.0)
+    parser.add_argument("--page-kb", type=float, default=20.0, help="Article text size")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of article requests that fail")
+    parser.add_argument("--recorded-serp", default=None, help="Serve this recorded SERP HTML for every search")
+    parser.add_argument(
+        "--scenarios",
+        default="scrape,search_api,remote",
+        help="Comma-separated subset of: scrape, search_api, remote",
+    )
+    parser.add_argument("--port", type=int, default=0, help="Mock server port (0 = any free port)")
+    parser.add_argument("--serve-only", action="store_true", help="Only run the mock server")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    conf = MockConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        serp_latency_ms=args.serp_latency_ms,
+        page_kb=args.page_kb,
+        failure_rate=args.failure_rate,
+        recorded_serp=args.recorded_serp,
+    )
+    mock = start_mock_server(conf, port=args.port)
+    base_url = f"http://127.0.0.1:{mock.server_address[1]}"
+    print(f"[BENCH] mock Google listening on {base_url}/search")
+
+    if args.serve_only:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return
+
+    # Must be set before the crawler module is imported
+    os.environ["MOCK_GOOGLE_SEARCH_URL"] = f"{base_url}/search"
+    os.environ["NO_PROXY"] = os.environ["no_proxy"] = "127.0.0.1,localhost"
+    sys.path.insert(0, BASE_DIR)
+
+    queries = [f"benchmark query {i}" for i in range(args.queries)]
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    report = {"config": vars(args), "results": []}
+
+    crawler = importlib.import_module("google_web_crawler")
+    if "scrape" in scenarios:
+        report["results"].append(bench_scrape(crawler, base_url, queries, args.top_k, args.max_workers))
+    if "search_api" in scenarios:
+        report["results"].append(bench_search_api(crawler, queries, args.top_k, args.max_workers))
+    if "remote" in scenarios:
+        remote = _load_script("remote_bench_module", REMOTE_SCRIPT)
+        report["results"].append(bench_remote(remote, queries, args.top_k))
+
+    mock.shutdown()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[BENCH] report written to '{args.output}'")
+    else:
+        print(json.dumps(report["results"], ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
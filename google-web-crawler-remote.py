@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 import argparse
 import json
+import logging
 import os
 import queue
+import socket
 import sys
 import threading
 import time
@@ -11,9 +13,29 @@ from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from urllib.parse import urlparse, parse_qs
 
+from content_pipeline import ContentPostProcessor
+from crawler_logging import configure_logging, get_logger
+from metrics import REGISTRY, STAGE_DURATION, render_snapshots, sanitize_snapshot, span
+from result_store import ShardedResultStore
+
+
+logger = get_logger("remote")
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Server request handling time by method and path"
+)
+TASK_QUEUE_WAIT = REGISTRY.histogram(
+    "task_queue_wait_seconds", "Time a task waited in the queue before a client took it"
+)
+TASK_DURATION = REGISTRY.histogram(
+    "task_duration_seconds", "Time from a client taking a task to its result upload"
+)
+TASK_COUNT = REGISTRY.gauge("tasks", "Tasks in the store by status")
+QUEUE_DEPTH = REGISTRY.gauge("task_queue_depth", "Tasks waiting in the pending queue")
+
 
 # ------------------------------
-# Simple in-memory task queue and result storage
+# Simple in-memory task queue; results are spilled to a sharded on-disk store
 # ------------------------------
 
 
@@ -32,12 +54,17 @@ class Task:
 
 
 class TaskStore:
-    def __init__(self):
+    def __init__(self, result_store: ShardedResultStore | None = None):
         self._pending_q: queue.Queue[str] = queue.Queue()
         self._tasks: dict[str, Task] = {}
+        # 仅在没有结果存储（或写盘失败）时才把结果留在内存里
         self._results: dict[str, list] = {}
+        self._result_store = result_store
         self._lock = threading.Lock()
 
+    def attach_result_store(self, result_store: ShardedResultStore | None):
+        self._result_store = result_store
+
     def enqueue(self, task: Task) -> str:
         with self._lock:
             self._tasks[task.id] = task
@@ -55,6 +82,7 @@ class TaskStore:
                 return None
             task.status = "running"
             task.started_at = time.time()
+            TASK_QUEUE_WAIT.observe(task.started_at - task.created_at)
             return task
 
     def set_result(self, task_id: str, results: list | None, error: str | None = None):
@@ -62,13 +90,25 @@ class TaskStore:
             task = self._tasks.get(task_id)
             if task is None:
                 return False
+        spilled = False
+        if not error and self._result_store is not None:
+            try:
+                # 写盘在锁外进行，避免阻塞其他请求
+                self._result_store.put(task_id, results or [], meta={"query": task.query})
+                spilled = True
+            except Exception as e:
+                logger.warning("write results failed: %s", e, extra={"task_id": task_id})
+        with self._lock:
             if error:
                 task.status = "failed"
                 task.error = str(error)
             else:
                 task.status = "done"
-                self._results[task_id] = results or []
+                if not spilled:
+                    self._results[task_id] = results or []
             task.finished_at = time.time()
+            if task.started_at is not None:
+                TASK_DURATION.observe(task.finished_at - task.started_at, status=task.status)
             return True
 
     def get_task(self, task_id: str) -> Task | None:
@@ -77,7 +117,29 @@ class TaskStore:
 
     def get_result(self, task_id: str) -> list | None:
         with self._lock:
-            return self._results.get(task_id)
+            if task_id in self._results:
+                return self._results[task_id]
+        if self._result_store is not None:
+            return self._result_store.get(task_id)
+        return None
+
+    def get_result_stream(self, task_id: str):
+        """返回 (results JSON 字节长度, 分块迭代器)；结果不在磁盘上时返回 None"""
+        with self._lock:
+            if task_id in self._results:
+                return None
+        if self._result_store is None:
+            return None
+        size = self._result_store.results_size(task_id)
+        if size is None:
+            return None
+        return size, self._result_store.iter_results_bytes(task_id)
+
+    def has_stored_result(self, task_id: str) -> bool:
+        return self._result_store is not None and task_id in self._result_store
+
+    def queue_depth(self) -> int:
+        return self._pending_q.qsize()
 
     def get_status(self) -> dict:
         with self._lock:
@@ -110,6 +172,32 @@ class TaskStore:
 
 GLOBAL_STORE = TaskStore()
 
+# 客户端随结果上传的指标快照：client_id -> snapshot
+CLIENT_METRICS: dict[str, dict] = {}
+CLIENT_METRICS_LOCK = threading.Lock()
+
+
+def render_metrics() -> str:
+    summary = GLOBAL_STORE.get_status()["summary"]
+    for status in ("queued", "running", "done", "failed"):
+        TASK_COUNT.set(summary[status], status=status)
+    QUEUE_DEPTH.set(GLOBAL_STORE.queue_depth())
+    labelled = [(REGISTRY.snapshot(), {"role": "server"})]
+    with CLIENT_METRICS_LOCK:
+        for client_id, snapshot in CLIENT_METRICS.items():
+            labelled.append((snapshot, {"role": "client", "client": client_id}))
+    return render_snapshots(labelled)
+
+
+def _metric_path(path: str) -> str:
+    # 避免 task_id 造成标签基数爆炸
+    path = urlparse(path).path.rstrip("/")
+    if path.startswith("/api/result/"):
+        return "/api/result/:id"
+    if path in ("/api/next", "/api/status", "/api/enqueue", "/api/result", "/metrics"):
+        return path
+    return "other"
+
 
 # ------------------------------
 # HTTP server implementation (using standard library only)
@@ -119,6 +207,22 @@ GLOBAL_STORE = TaskStore()
 class APIServerHandler(BaseHTTPRequestHandler):
     server_version = "CrawlerRemoteHTTP/1.0"
 
+    def log_message(self, format, *args):
+        # 访问日志降为 DEBUG，避免每个请求都写 stderr
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(format, *args, extra={"client": self.address_string()})
+
+    def handle_one_request(self):
+        self.command = None
+        started = time.perf_counter()
+        super().handle_one_request()
+        if self.command:
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                method=self.command,
+                path=_metric_path(self.path),
+            )
+
     def _read_json(self) -> dict:
         try:
             length = int(self.headers.get("Content-Length", "0"))
@@ -135,6 +239,19 @@ class APIServerHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(payload)
 
+    def _write_json_stream(self, head: dict, key: str, size: int, chunks, status: int = 200):
+        """写出 head 对象并把 key 字段的值（已是 JSON 字节）从 chunks 流式拼接进去"""
+        prefix = (json.dumps(head, ensure_ascii=False)[:-1] + f', "{key}": ').encode("utf-8")
+        suffix = b"}"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(prefix) + size + len(suffix)))
+        self.end_headers()
+        self.wfile.write(prefix)
+        for chunk in chunks:
+            self.wfile.write(chunk)
+        self.wfile.write(suffix)
+
     def _check_token(self) -> bool:
         # 允许 query 参数或 Header
         token_conf = getattr(self.server, "auth_token", None)
@@ -175,24 +292,37 @@ class APIServerHandler(BaseHTTPRequestHandler):
             self._write_json(GLOBAL_STORE.get_status())
             return
 
+        if path == "/metrics":
+            payload = render_metrics().encode("utf-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
         if path.startswith("/api/result/"):
             task_id = path.split("/", 3)[-1]
-            result = GLOBAL_STORE.get_result(task_id)
             task = GLOBAL_STORE.get_task(task_id)
-            if task is None:
+            if task is not None:
+                task_info = {"id": task.id, "status": task.status, "error": task.error}
+            elif GLOBAL_STORE.has_stored_result(task_id):
+                # 服务重启后任务元数据已丢失，但结果仍在磁盘上
+                task_info = {"id": task_id, "status": "done", "error": None}
+            else:
                 self._write_json(
                     {"error": "task_not_found"}, status=HTTPStatus.NOT_FOUND
                 )
                 return
-            self._write_json(
-                {
-                    "task": {
-                        "id": task.id,
-                        "status": task.status,
-                        "error": task.error,
-                    },
-                    "results": result,
-                }
+            stream = GLOBAL_STORE.get_result_stream(task_id)
+            if stream is None:
+                self._write_json(
+                    {"task": task_info, "results": GLOBAL_STORE.get_result(task_id)}
+                )
+                return
+            size, chunks = stream
+            self._write_json_stream(
+                {"task": task_info}, "results", size, chunks
             )
             return
 
@@ -229,6 +359,12 @@ class APIServerHandler(BaseHTTPRequestHandler):
             task_id = data.get("task_id")
             results = data.get("results")
             error = data.get("error")
+            client_id = data.get("client_id")
+            if client_id and isinstance(data.get("metrics"), dict):
+                # 只保留格式正确的指标族，避免一个异常快照让之后所有 /metrics 请求报错
+                snapshot = sanitize_snapshot(data["metrics"])
+                with CLIENT_METRICS_LOCK:
+                    CLIENT_METRICS[str(client_id)] = snapshot
             if not task_id:
                 self._write_json(
                     {"error": "task_id_required"}, status=HTTPStatus.BAD_REQUEST
@@ -241,21 +377,6 @@ class APIServerHandler(BaseHTTPRequestHandler):
                 )
                 return
 
-            # 如果配置了输出目录，落盘保存一份
-            out_dir = getattr(self.server, "output_dir", None)
-            if out_dir and not error and isinstance(results, list):
-                try:
-                    os.makedirs(out_dir, exist_ok=True)
-                    outfile = os.path.join(out_dir, f"{task_id}.jsonl")
-                    with open(outfile, "w", encoding="utf-8") as f:
-                        for item in results:
-                            f.write(json.dumps(item, ensure_ascii=False) + "\n")
-                except Exception as e:
-                    # 不阻断主流程，写入失败只记录
-                    sys.stderr.write(
-                        f"[WARN] write results failed for {task_id}: {e}\n"
-                    )
-
             self._write_json({"ok": True})
             return
 
@@ -267,15 +388,20 @@ def run_server(host: str, port: int, token: str | None, output_dir: str | None):
     # 挂载配置到server对象上供Handler读取
     httpd.auth_token = token
     httpd.output_dir = output_dir
-    print(
-        f"[SERVER] listening on http://{host}:{port}  (token={'<none>' if not token else '***'})"
+    # 结果写入分片存储，内存中只保留索引
+    GLOBAL_STORE.attach_result_store(ShardedResultStore(output_dir) if output_dir else None)
+    logger.info(
+        "server listening on http://%s:%s (token=%s)",
+        host,
+        port,
+        "<none>" if not token else "***",
     )
     if output_dir:
-        print(f"[SERVER] results will be saved to '{output_dir}'")
+        logger.info("results will be saved to sharded store '%s'", output_dir)
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
-        print("\n[SERVER] shutting down...")
+        logger.info("server shutting down...")
     finally:
         httpd.server_close()
 
@@ -285,15 +411,27 @@ def run_server(host: str, port: int, token: str | None, output_dir: str | None):
 # ------------------------------
 
 
-def _load_crawler_module(crawler_script_path: str):
+def _load_crawler_module(crawler_script_path: str | None):
+    import importlib
     import importlib.util
 
+    if crawler_script_path is None:
+        # 默认直接导入同目录下的 google_web_crawler 模块，无需按文件路径执行脚本
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        if script_dir not in sys.path:
+            sys.path.insert(0, script_dir)
+        return importlib.import_module("google_web_crawler")
+
     spec = importlib.util.spec_from_file_location(
         "crawler_local_module", crawler_script_path
     )
     if spec is None or spec.loader is None:
         raise RuntimeError(f"Failed to load crawler script: {crawler_script_path}")
     module = importlib.util.module_from_spec(spec)
+    # 让爬虫脚本可以导入其同目录下的模块（如 result_store）
+    script_dir = os.path.dirname(os.path.abspath(crawler_script_path))
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
     spec.loader.exec_module(module)  # type: ignore[attr-defined]
     required = [
         "search_google",
@@ -310,20 +448,42 @@ def _load_crawler_module(crawler_script_path: str):
 def client_loop(
     server_base_url: str,
     token: str | None,
-    crawler_script_path: str,
+    crawler_script_path: str | None = None,
     poll_interval: float = 3.0,
     disable_http_proxy: bool = False,
+    search_mode: str = "browser",
+    scrape_delay: float = 1.0,
+    max_tasks: int | None = None,
+    post_processor: ContentPostProcessor | None = None,
 ):
-    # 动态加载现有的 google-web-crawler.py
+    # 导入 google_web_crawler 模块（或按路径加载自定义爬虫脚本）
     module = _load_crawler_module(crawler_script_path)
 
+    # browser: 始终用 Chrome 搜索；tiered: 先走 HTTP 快速通道，失败再用 Chrome；http: 只走 HTTP
+    if search_mode not in ("browser", "tiered", "http"):
+        raise ValueError(f"unknown search_mode: {search_mode}")
+    fetchers = {}
+
+    def _search(query, top_k, proxy, filter_year):
+        if search_mode == "browser":
+            return module.search_google(
+                query, num_results=top_k, proxy=proxy, filter_year=filter_year
+            )
+        # 按代理复用 fetcher，以便复用 HTTP 会话与 cookies
+        fetcher = fetchers.get(proxy)
+        if fetcher is None:
+            fetcher = fetchers[proxy] = module.TieredSearchFetcher(
+                proxy=proxy, use_http=True, use_browser=(search_mode == "tiered")
+            )
+        return fetcher.search(query, num_results=top_k, filter_year=filter_year)
+
     import urllib.request
     import urllib.error
 
     # 构建opener：当禁用代理时，忽略系统环境中的 http_proxy/https_proxy
     if disable_http_proxy:
         opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
-        print("[CLIENT] HTTP proxy disabled for server requests")
+        logger.info("HTTP proxy disabled for server requests")
     else:
         opener = urllib.request.build_opener()
 
@@ -339,22 +499,30 @@ def client_loop(
             return f"{server_base_url.rstrip('/')}{path}{sep}token={token}"
         return f"{server_base_url.rstrip('/')}{path}"
 
-    print(f"[CLIENT] connecting to {server_base_url} ...")
-    print(f"[CLIENT] using crawler script: {crawler_script_path}")
+    client_id = f"{socket.gethostname()}-{os.getpid()}"
 
-    while True:
+    logger.info(
+        "client connecting to %s",
+        server_base_url,
+        extra={"crawler": crawler_script_path or "google_web_crawler", "search_mode": search_mode},
+    )
+
+    tasks_done = 0
+    while max_tasks is None or tasks_done < max_tasks:
         try:
             # 拉取任务
             req = urllib.request.Request(
                 _url("/api/next"), headers=_headers(), method="GET"
             )
             try:
-                with opener.open(req, timeout=30) as resp:
+                with span("task_poll"), opener.open(req, timeout=30) as resp:
                     status = resp.getcode()
-                    if status == HTTPStatus.NO_CONTENT:
-                        time.sleep(poll_interval)
-                        continue
-                    payload = json.loads(resp.read().decode("utf-8") or "{}")
+                    body = resp.read()
+                # 在 span 之外等待，空轮询的间隔不计入拉取耗时
+                if status == HTTPStatus.NO_CONTENT:
+                    time.sleep(poll_interval)
+                    continue
+                payload = json.loads(body.decode("utf-8") or "{}")
             except urllib.error.HTTPError as e:
                 if e.code == HTTPStatus.NO_CONTENT:
                     time.sleep(poll_interval)
@@ -362,7 +530,7 @@ def client_loop(
                 raise
             except urllib.error.URLError as e:
                 # 常见：被系统代理转发失败产生的 Bad Gateway / 连接失败
-                print(f"[CLIENT] fetch task failed (network): {e}")
+                logger.warning("fetch task failed (network): %s", e)
                 time.sleep(max(5.0, poll_interval))
                 continue
 
@@ -376,23 +544,19 @@ def client_loop(
                 time.sleep(poll_interval)
                 continue
 
-            print(f"[CLIENT] got task {task_id}: '{query}' (top_k={top_k})")
+            logger.info("got task", extra={"task_id": task_id, "query": query, "top_k": top_k})
 
             # Execute search
+            exec_started = time.perf_counter()
             try:
-                # Use the search_google function directly
-                results = module.search_google(
-                    query, 
-                    num_results=top_k, 
-                    proxy=proxy, 
-                    filter_year=filter_year
-                )
+                results = _search(query, top_k, proxy, filter_year)
                 
                 # If we got results, scrape the pages
                 if results:
                     final_results = []
                     for idx, result in enumerate(results):
-                        time.sleep(1)  # Be polite to servers
+                        if scrape_delay > 0:
+                            time.sleep(scrape_delay)  # Be polite to servers
                         page_data = module.scrape_page_content(result['link'], idx)
                         
                         if page_data and page_data["full_content"]:
@@ -407,12 +571,16 @@ def client_loop(
                                 "content": page_data["full_content"]
                             }
                             final_results.append(search_result)
+                    # 上传前先批量提取相关片段并裁剪正文，减小 /api/result 的负载
+                    if post_processor is not None:
+                        post_processor.process_batch(final_results, query)
                     results = final_results
                 
                 error = None
             except Exception as e:
                 results = None
                 error = f"client_exec_error: {e}"
+            STAGE_DURATION.observe(time.perf_counter() - exec_started, stage="task_execute")
 
             # 回传结果
             result_req = urllib.request.Request(
@@ -423,28 +591,34 @@ def client_loop(
                         "task_id": task_id,
                         "results": results,
                         "error": error,
+                        # 附带本机指标快照，供服务端 /metrics 汇总展示
+                        "client_id": client_id,
+                        "metrics": REGISTRY.snapshot(),
                     },
                     ensure_ascii=False,
                 ).encode("utf-8"),
                 method="POST",
             )
             try:
-                with opener.open(result_req, timeout=60) as resp:
+                with span("result_upload"), opener.open(result_req, timeout=60) as resp:
                     _ = resp.read()
                 if error:
-                    print(f"[CLIENT] task {task_id} failed: {error}")
+                    logger.warning("task failed: %s", error, extra={"task_id": task_id})
                 else:
-                    print(
-                        f"[CLIENT] task {task_id} done, {len(results or [])} results uploaded"
+                    logger.info(
+                        "task done, %d results uploaded",
+                        len(results or []),
+                        extra={"task_id": task_id},
                     )
             except Exception as e:
-                print(f"[CLIENT] upload result failed for task {task_id}: {e}")
+                logger.error("upload result failed: %s", e, extra={"task_id": task_id})
+            tasks_done += 1
 
         except KeyboardInterrupt:
-            print("\n[CLIENT] interrupted, exiting...")
+            logger.info("client interrupted, exiting...")
             break
         except Exception as e:
-            print(f"[CLIENT] loop error: {e}")
+            logger.error("client loop error: %s", e)
             time.sleep(max(5.0, poll_interval))
 
 
@@ -455,15 +629,27 @@ def client_loop(
 
 def main():
     default_dir = os.path.dirname(os.path.abspath(__file__))
-    default_crawler_script = os.path.join(default_dir, "google-web-crawler.py")
 
     parser = argparse.ArgumentParser(
         description="Remote runner for google-web-crawler: 在服务器与本机之间建立任务分发与结果回传",
     )
     sub = parser.add_subparsers(dest="cmd", required=True)
 
+    # server / client 共用的日志参数
+    log_parent = argparse.ArgumentParser(add_help=False)
+    log_parent.add_argument("--log-level", default="INFO", help="DEBUG 时输出逐请求/逐URL日志")
+    log_parent.add_argument("--log-format", choices=["json", "text"], default="json")
+    log_parent.add_argument(
+        "--url-log-sample-rate",
+        type=float,
+        default=1.0,
+        help="低于 WARNING 的逐URL日志的采样比例",
+    )
+
     # server
-    p_server = sub.add_parser("server", help="启动服务器端（任务队列 + 结果收集）")
+    p_server = sub.add_parser(
+        "server", help="启动服务器端（任务队列 + 结果收集）", parents=[log_parent]
+    )
     p_server.add_argument("--host", default="0.0.0.0")
     p_server.add_argument("--port", type=int, default=8765)
     p_server.add_argument("--token", default=None, help="服务访问令牌，建议设置")
@@ -472,15 +658,17 @@ def main():
     )
 
     # client
-    p_client = sub.add_parser("client", help="在本机运行客户端，使用Chrome执行搜索")
+    p_client = sub.add_parser(
+        "client", help="在本机运行客户端，使用Chrome执行搜索", parents=[log_parent]
+    )
     p_client.add_argument(
         "--server", required=True, help="服务器地址，例如 http://<SERVER_IP>:8765"
     )
     p_client.add_argument("--token", default=None, help="与服务器一致的访问令牌")
     p_client.add_argument(
         "--crawler-script",
-        default=default_crawler_script,
-        help="本地可执行的 google-web-crawler.py 路径",
+        default=None,
+        help="自定义爬虫脚本路径；默认导入同目录下的 google_web_crawler 模块",
     )
     p_client.add_argument("--poll-interval", type=float, default=3.0)
     p_client.add_argument(
@@ -488,6 +676,37 @@ def main():
         action="store_true",
         help="禁用客户端对服务器请求使用系统代理(http_proxy/https_proxy)",
     )
+    p_client.add_argument(
+        "--search-mode",
+        choices=["browser", "tiered", "http"],
+        default="browser",
+        help="browser: 始终使用Chrome；tiered: 先尝试HTTP快速通道，失败再用Chrome；http: 只用HTTP",
+    )
+    p_client.add_argument(
+        "--scrape-delay", type=float, default=1.0, help="抓取相邻页面之间的间隔秒数"
+    )
+    p_client.add_argument(
+        "--max-tasks", type=int, default=None, help="处理完指定数量的任务后退出"
+    )
+    p_client.add_argument(
+        "--max-content-tokens", type=int, default=None, help="每个页面正文的近似 token 上限"
+    )
+    p_client.add_argument(
+        "--max-content-chars", type=int, default=None, help="每个页面正文的字符数上限"
+    )
+    p_client.add_argument(
+        "--top-passages",
+        type=int,
+        default=None,
+        help="只保留与查询最相关（BM25）的前 N 个段落",
+    )
+    p_client.add_argument("--passage-tokens", type=int, default=120, help="段落的近似 token 数")
+    p_client.add_argument(
+        "--snippets",
+        type=int,
+        default=3,
+        help="为每个结果附加与查询最相关的前 N 个片段（0 表示不附加）",
+    )
 
     # enqueue (便捷命令)：直接在服务器上添加任务
     p_enq = sub.add_parser(
@@ -515,6 +734,11 @@ def main():
 
     args = parser.parse_args()
 
+    if args.cmd in ("server", "client"):
+        configure_logging(
+            args.log_level, args.log_format, url_sample_rate=args.url_log_sample_rate
+        )
+
     if args.cmd == "server":
         os.makedirs(args.output_dir, exist_ok=True)
         run_server(args.host, args.port, args.token, args.output_dir)
@@ -527,6 +751,16 @@ def main():
             crawler_script_path=args.crawler_script,
             poll_interval=args.poll_interval,
             disable_http_proxy=args.no_proxy,
+            search_mode=args.search_mode,
+            scrape_delay=args.scrape_delay,
+            max_tasks=args.max_tasks,
+            post_processor=ContentPostProcessor(
+                max_chars=args.max_content_chars,
+                max_tokens=args.max_content_tokens,
+                top_passages=args.top_passages,
+                passage_tokens=args.passage_tokens,
+                snippets=args.snippets or None,
+            ),
         )
         return
 
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Minimal in-process metrics with Prometheus text exposition (standard library only).
+
+Stages of the pipeline are timed with `span`:
+
+    with span("driver_get"):
+        driver.get(search_url)
+
+which records the duration in the `stage_duration_seconds{stage="driver_get"}`
+histogram of the process-wide REGISTRY. A registry can be exported as a
+JSON-serializable snapshot, so the remote client ships its metrics to the
+server along with each result and the server's /metrics endpoint shows both.
+"""
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            series = [{"labels": dict(k), "value": v} for k, v in self._values.items()]
+        return {"type": "counter", "help": self.help, "series": series}
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = float(value)
+
+    def snapshot(self) -> dict:
+        snap = super().snapshot()
+        snap["type"] = "gauge"
+        return snap
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        slot = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                slot = i
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            series = [
+                {"labels": dict(k), "counts": list(s[0]), "sum": s[1], "count": s[2]}
+                for k, s in self._series.items()
+            ]
+        return {"type": "histogram", "help": self.help, "buckets": list(self.buckets), "series": series}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str = "", buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+    def render(self, extra_labels: dict | None = None) -> str:
+        return render_snapshot(self.snapshot(), extra_labels)
+
+
+_NAME_RE = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+_LABEL_RE = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _valid_series(metric: dict, series) -> bool:
+    if not isinstance(series, dict):
+        return False
+    labels = series.get("labels")
+    if not isinstance(labels, dict) or not all(isinstance(k, str) and _LABEL_RE.match(k) for k in labels):
+        return False
+    if metric["type"] != "histogram":
+        return _is_number(series.get("value"))
+    counts = series.get("counts")
+    return (
+        isinstance(counts, list)
+        and len(counts) == len(metric["buckets"]) + 1
+        and all(_is_number(c) for c in counts)
+        and _is_number(series.get("sum"))
+        and _is_number(series.get("count"))
+    )
+
+
+def _valid_family(name, metric) -> bool:
+    if not isinstance(name, str) or not _NAME_RE.match(name) or not isinstance(metric, dict):
+        return False
+    if metric.get("type") not in ("counter", "gauge", "histogram"):
+        return False
+    if metric["type"] == "histogram":
+        buckets = metric.get("buckets")
+        if not isinstance(buckets, list) or not all(_is_number(b) for b in buckets):
+            return False
+    series = metric.get("series")
+    return isinstance(series, list) and all(_valid_series(metric, s) for s in series)
+
+
+def sanitize_snapshot(snapshot) -> dict:
+    """
+    Returns the well-formed metric families of an untrusted snapshot, such as
+    one uploaded by a remote client, dropping any family render_snapshots
+    could not render.
+    """
+    if not isinstance(snapshot, dict):
+        return {}
+    return {name: metric for name, metric in snapshot.items() if _valid_family(name, metric)}
+
+
+def render_snapshot(snapshot: dict, extra_labels: dict | None = None) -> str:
+    """Renders a registry snapshot in the Prometheus text exposition format."""
+    return render_snapshots([(snapshot, extra_labels)])
+
+
+def render_snapshots(labelled_snapshots: list) -> str:
+    """
+    Renders several (snapshot, extra_labels) pairs as one exposition, so a
+    metric present in more than one snapshot gets a single HELP/TYPE header.
+    """
+    families: dict[str, dict] = {}
+    for snapshot, extra_labels in labelled_snapshots:
+        extra = dict(extra_labels or {})
+        for name, metric in snapshot.items():
+            family = families.setdefault(name, {**metric, "series": []})
+            if family["type"] != metric["type"] or family.get("buckets") != metric.get("buckets"):
+                # The same name with another type or bucket layout cannot share one family
+                continue
+            for series in metric["series"]:
+                family["series"].append({**series, "labels": {**extra, **series["labels"]}})
+
+    lines = []
+    for name, metric in sorted(families.items()):
+        lines.append(f"# HELP {name} {metric.get('help', '')}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for series in metric["series"]:
+            labels = series["labels"]
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(series['value'])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric["buckets"]) + [math.inf], series["counts"]):
+                cumulative += count
+                bucket_labels = {**labels, "le": _format_value(bound)}
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(series['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {series['count']}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "stage_duration_seconds", "Duration of each pipeline stage"
+)
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """Times the enclosed block into stage_duration_seconds{stage=...}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - started, stage=stage, **labels)
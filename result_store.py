@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Append-only sharded storage for search results.
+
+Every record is the full result list of one key (a query in batch mode, a
+task id on the remote server) written as a single line to a rolling shard
+file. An index maps each key to (shard, offset, length), so a record can be
+read back with one seek instead of keeping one small file per key.
+
+The results array is the last member of each record and its byte range is
+indexed too, so an uncompressed store can stream a key's results JSON
+straight from disk without parsing it.
+
+Layout of a store directory:
+
+    shard-00000.jsonl[.zst]
+    shard-00001.jsonl[.zst]
+    ...
+    index.jsonl          one {"key", "shard", "offset", "length",
+                              "results_offset", "results_length"} per line
+
+With compression="zstd" (requires the optional `zstandard` package) every
+record is its own zstd frame, so records stay individually addressable.
+"""
+import json
+import os
+import sys
+import threading
+
+
+DEFAULT_MAX_SHARD_BYTES = 256 * 1024 * 1024
+INDEX_FILENAME = "index.jsonl"
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("compression='zstd' requires the 'zstandard' package")
+    return zstandard
+
+
+class ShardedResultStore:
+    def __init__(
+        self,
+        root_dir: str,
+        max_shard_bytes: int = DEFAULT_MAX_SHARD_BYTES,
+        compression: str | None = None,
+    ):
+        if compression not in (None, "zstd"):
+            raise ValueError(f"unsupported compression: {compression}")
+        self.root_dir = root_dir
+        self.max_shard_bytes = int(max_shard_bytes)
+        self.compression = compression
+        self._suffix = ".jsonl.zst" if compression == "zstd" else ".jsonl"
+        self._compressor = _zstd().ZstdCompressor() if compression else None
+        self._decompressor = _zstd().ZstdDecompressor() if compression else None
+        # key -> (shard, offset, length, results_offset, results_length)
+        self._index: dict[str, tuple[int, int, int, int, int]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+        self._load_index()
+        self._shard_id = max((loc[0] for loc in self._index.values()), default=0)
+        self._truncate_unindexed_tail()
+
+    # ---- index ----
+
+    def _index_path(self) -> str:
+        return os.path.join(self.root_dir, INDEX_FILENAME)
+
+    def _shard_path(self, shard_id: int) -> str:
+        return os.path.join(self.root_dir, f"shard-{shard_id:05d}{self._suffix}")
+
+    def _load_index(self):
+        path = self._index_path()
+        if not os.path.exists(path):
+            return
+        with open(path, "r+b") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                # A torn last line from a crash mid-write: cut it so the next
+                # put starts on a fresh line instead of appending onto it
+                f.truncate(end)
+        for line in data[:end].decode("utf-8", errors="replace").splitlines():
+            try:
+                entry = json.loads(line)
+                self._index[entry["key"]] = (
+                    int(entry["shard"]),
+                    int(entry["offset"]),
+                    int(entry["length"]),
+                    int(entry.get("results_offset", -1)),
+                    int(entry.get("results_length", -1)),
+                )
+            except (ValueError, KeyError):
+                continue
+
+    def _truncate_unindexed_tail(self):
+        # Drop bytes a crash left in the active shard after its last indexed record
+        path = self._shard_path(self._shard_id)
+        if not os.path.exists(path):
+            return
+        end = max(
+            (loc[1] + loc[2] for loc in self._index.values() if loc[0] == self._shard_id),
+            default=0,
+        )
+        if os.path.getsize(path) > end:
+            with open(path, "r+b") as f:
+                f.truncate(end)
+
+    # ---- public API ----
+
+    def put(self, key: str, results: list, meta: dict | None = None) -> tuple[int, int, int]:
+        """Appends the results for key and returns its (shard, offset, length)."""
+        head = {"key": key}
+        if meta:
+            head["meta"] = meta
+        prefix = (json.dumps(head, ensure_ascii=False)[:-1] + ', "results": ').encode("utf-8")
+        results_data = json.dumps(results, ensure_ascii=False).encode("utf-8")
+        data = prefix + results_data + b"}\n"
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+
+        with self._lock:
+            path = self._shard_path(self._shard_id)
+            if os.path.exists(path) and os.path.getsize(path) + len(data) > self.max_shard_bytes:
+                self._shard_id += 1
+                path = self._shard_path(self._shard_id)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # Offsets of the results array within the uncompressed record
+            location = (self._shard_id, offset, len(data), len(prefix), len(results_data))
+            with open(self._index_path(), "a", encoding="utf-8") as f:
+                f.write(
+                    json.dumps(
+                        {
+                            "key": key,
+                            "shard": location[0],
+                            "offset": offset,
+                            "length": len(data),
+                            "results_offset": location[3],
+                            "results_length": location[4],
+                        },
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+            self._index[key] = location
+            return location[:3]
+
+    def _read_record_bytes(self, location: tuple) -> bytes:
+        shard_id, offset, length = location[:3]
+        with open(self._shard_path(shard_id), "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        return data
+
+    def get_record(self, key: str) -> dict | None:
+        """Returns the stored record {"key", ["meta"], "results"} for key, or None."""
+        with self._lock:
+            location = self._index.get(key)
+        if location is None:
+            return None
+        return json.loads(self._read_record_bytes(location).decode("utf-8"))
+
+    def results_size(self, key: str) -> int | None:
+        """Returns the byte length of the results JSON for key, or None if absent."""
+        with self._lock:
+            location = self._index.get(key)
+        if location is None:
+            return None
+        if location[4] >= 0:
+            return location[4]
+        return len(self._results_bytes_fallback(location))
+
+    def _results_bytes_fallback(self, location: tuple) -> bytes:
+        # Records indexed without a results byte range: re-serialize the results
+        record = json.loads(self._read_record_bytes(location).decode("utf-8"))
+        return json.dumps(record["results"], ensure_ascii=False).encode("utf-8")
+
+    def iter_results_bytes(self, key: str, chunk_size: int = 64 * 1024):
+        """
+        Yields the results JSON array for key in chunks, read straight from the
+        shard when the store is uncompressed. Yields nothing if key is absent.
+        """
+        with self._lock:
+            location = self._index.get(key)
+        if location is None:
+            return
+        shard_id, offset, _, results_offset, results_length = location
+        if self._decompressor is not None or results_offset < 0:
+            if results_offset < 0:
+                data = self._results_bytes_fallback(location)
+            else:
+                data = self._read_record_bytes(location)[results_offset:results_offset + results_length]
+            for start in range(0, len(data), chunk_size):
+                yield data[start:start + chunk_size]
+            return
+        with open(self._shard_path(shard_id), "rb") as f:
+            f.seek(offset + results_offset)
+            remaining = results_length
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def get(self, key: str) -> list | None:
+        record = self.get_record(key)
+        return None if record is None else record["results"]
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._index
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect a sharded result store")
+    parser.add_argument("store_dir")
+    parser.add_argument("key", nargs="?", help="Print the results for this key; list keys if omitted")
+    parser.add_argument("--compression", choices=["zstd"], default=None)
+    args = parser.parse_args()
+
+    store = ShardedResultStore(args.store_dir, compression=args.compression)
+    if args.key is None:
+        for key in store.keys():
+            print(key)
+        return
+    results = store.get(args.key)
+    if results is None:
+        print(json.dumps({"error": "key_not_found"}, ensure_ascii=False))
+        sys.exit(1)
+    for item in results:
+        print(json.dumps(item, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Local search service: one long-running process that keeps a SearchClient warm
+(HTTP session, browser, redirect and response caches) and answers searches
+synchronously, like a hosted search API.
+
+    GET /search?q=<query>[&top_k=5][&year=2023]
+        -> {"query", "top_k", "results", "took_ms"}
+    GET /healthz   -> {"status": "ok", "stats": {...}}
+    GET /metrics   -> Prometheus text exposition
+
+Example:
+
+    python search_service.py --port 8080 --search-mode tiered
+    curl 'http://127.0.0.1:8080/search?q=transformer+in+deep+learning&top_k=3'
+"""
+import argparse
+import json
+import logging
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from content_pipeline import ContentPostProcessor
+from crawler_logging import configure_logging, get_logger
+from google_web_crawler import SearchClient
+from metrics import REGISTRY
+
+
+logger = get_logger("service")
+
+SEARCH_DURATION = REGISTRY.histogram(
+    "service_search_duration_seconds", "End-to-end /search latency by outcome"
+)
+
+MAX_TOP_K = 20
+
+
+class SearchServiceHandler(BaseHTTPRequestHandler):
+    server_version = "CrawlerSearchService/1.0"
+
+    def log_message(self, format, *args):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(format, *args, extra={"client": self.address_string()})
+
+    def _write_json(self, obj: dict, status: int = 200):
+        payload = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _check_token(self, qs: dict) -> bool:
+        token_conf = getattr(self.server, "auth_token", None)
+        if not token_conf:
+            return True
+        if self.headers.get("X-Auth-Token") == token_conf:
+            return True
+        return qs.get("token", [None])[0] == token_conf
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path.rstrip("/")
+        qs = parse_qs(parsed.query)
+        if not self._check_token(qs):
+            self._write_json({"error": "unauthorized"}, status=HTTPStatus.UNAUTHORIZED)
+            return
+
+        if path == "/search":
+            self._handle_search(qs)
+            return
+
+        if path == "/healthz":
+            self._write_json({"status": "ok", "stats": self.server.search_client.report()})
+            return
+
+        if path == "/metrics":
+            payload = REGISTRY.render().encode("utf-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self._write_json({"error": "not_found"}, status=HTTPStatus.NOT_FOUND)
+
+    def _handle_search(self, qs: dict):
+        query = (qs.get("q", [""])[0]).strip()
+        if not query:
+            self._write_json({"error": "query_required"}, status=HTTPStatus.BAD_REQUEST)
+            return
+        try:
+            top_k = int(qs.get("top_k", ["5"])[0])
+            year = qs.get("year", [None])[0]
+            filter_year = int(year) if year else None
+        except ValueError:
+            self._write_json({"error": "invalid_parameter"}, status=HTTPStatus.BAD_REQUEST)
+            return
+        if not 1 <= top_k <= MAX_TOP_K:
+            self._write_json({"error": f"top_k must be between 1 and {MAX_TOP_K}"}, status=HTTPStatus.BAD_REQUEST)
+            return
+
+        started = time.perf_counter()
+        try:
+            results = self.server.search_client.search(query, top_k=top_k, filter_year=filter_year)
+        except Exception as e:
+            SEARCH_DURATION.observe(time.perf_counter() - started, outcome="error")
+            logger.error("search failed: %s", e, extra={"query": query})
+            self._write_json({"error": "search_failed"}, status=HTTPStatus.INTERNAL_SERVER_ERROR)
+            return
+        elapsed = time.perf_counter() - started
+        SEARCH_DURATION.observe(elapsed, outcome="ok" if results else "empty")
+        self._write_json(
+            {"query": query, "top_k": top_k, "results": results, "took_ms": round(elapsed * 1000, 1)}
+        )
+
+
+def run_service(client: SearchClient, host: str, port: int, token: str | None = None):
+    httpd = ThreadingHTTPServer((host, port), SearchServiceHandler)
+    httpd.daemon_threads = True
+    httpd.search_client = client
+    httpd.auth_token = token
+    logger.info(
+        "search service listening on http://%s:%s/search (mode=%s)", host, httpd.server_address[1],
+        client.search_mode,
+    )
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("search service shutting down...")
+    finally:
+        httpd.server_close()
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synchronous /search requests from a warm crawler")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--token", default=None, help="Require this token (X-Auth-Token header or ?token=)")
+    parser.add_argument("--proxy", default=None)
+    parser.add_argument("--search-mode", choices=list(SearchClient.SEARCH_MODES), default="tiered")
+    parser.add_argument("--max-workers", type=int, default=3)
+    parser.add_argument("--cache-ttl", type=float, default=300.0, help="Seconds to cache a response (0 disables)")
+    parser.add_argument("--cache-size", type=int, default=256)
+    parser.add_argument("--hedge-after", type=float, default=3.0, help="Duplicate requests slower than this")
+    parser.add_argument("--max-content-tokens", type=int, default=None, help="Approximate token cap per page")
+    parser.add_argument("--max-content-chars", type=int, default=None, help="Character cap per page")
+    parser.add_argument("--top-passages", type=int, default=None, help="Keep the N most query-relevant passages")
+    parser.add_argument("--passage-tokens", type=int, default=120)
+    parser.add_argument("--snippets", type=int, default=3, help="Query-relevant snippets per result (0 disables)")
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--log-format", choices=["json", "text"], default="json")
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_format)
+
+    client = SearchClient(
+        proxy=args.proxy,
+        search_mode=args.search_mode,
+        max_workers=args.max_workers,
+        hedge_after=args.hedge_after,
+        cache_ttl=args.cache_ttl,
+        cache_size=args.cache_size,
+        post_processor=ContentPostProcessor(
+            max_chars=args.max_content_chars,
+            max_tokens=args.max_content_tokens,
+            top_passages=args.top_passages,
+            passage_tokens=args.passage_tokens,
+            snippets=args.snippets or None,
+        ),
+    )
+    run_service(client, args.host, args.port, token=args.token)
+
+
+if __name__ == "__main__":
+    main()